@@ -1,38 +1,55 @@
-import json
+import orjson
+import ijson
 
 IN_PATH = "question_bank.json"
 OUT_PATH = "question_bank_L1_1_only.json"
 TARGET_LECTURE_ID = "L1_1"
 
-with open(IN_PATH, "r", encoding="utf-8") as f:
-    qb = json.load(f)
-
-# 1) Keep only L1_1 lecture
-lectures = qb.get("lectures", [])
-keep_lectures = [lec for lec in lectures if lec.get("lecture_id") == TARGET_LECTURE_ID]
-if not keep_lectures:
-    raise ValueError(f"Lecture_id={TARGET_LECTURE_ID} not found in {IN_PATH}")
-
-# 2) Collect concept tags used by those questions
-used_tags = set()
-for lec in keep_lectures:
-    for q in lec.get("questions", []):
-        used_tags.update(q.get("concept_tags", []))
-
-# 3) Filter ontology to only those tags
-ontology = qb.get("ontology", {})
-filtered_ontology = {tag: ontology[tag] for tag in sorted(used_tags) if tag in ontology}
-
-# 4) Build new question bank
-new_qb = {
-    "ontology": filtered_ontology,
-    "lectures": keep_lectures,
-    "assignments": []
-}
-
-with open(OUT_PATH, "w", encoding="utf-8") as f:
-    json.dump(new_qb, f, ensure_ascii=False, indent=2)
-
-print(f"Wrote {OUT_PATH}")
-print(f"Kept lecture: {TARGET_LECTURE_ID}")
-print(f"Kept tags: {sorted(used_tags)}")
+def extract_lecture_bank(in_path: str, lecture_id: str) -> dict:
+    """
+    Build a question bank containing only one lecture, streaming in_path.
+
+    Callers that go on to generate attempts can use the returned dict
+    directly, without writing and re-reading an intermediate JSON file.
+    """
+    # 1) Keep only the target lecture, streaming the lectures array with
+    #    ijson so the full question bank (all other lectures + assignments)
+    #    is never held in memory
+    keep_lectures = []
+    with open(in_path, "rb") as f:
+        for lec in ijson.items(f, "lectures.item"):
+            if lec.get("lecture_id") == lecture_id:
+                keep_lectures.append(lec)
+    if not keep_lectures:
+        raise ValueError(f"Lecture_id={lecture_id} not found in {in_path}")
+
+    # 2) Collect concept tags used by those questions
+    used_tags = set()
+    for lec in keep_lectures:
+        for q in lec.get("questions", []):
+            used_tags.update(q.get("concept_tags", []))
+
+    # 3) Filter ontology to only those tags, again streaming key by key
+    filtered_ontology = {}
+    with open(in_path, "rb") as f:
+        for tag, entry in ijson.kvitems(f, "ontology"):
+            if tag in used_tags:
+                filtered_ontology[tag] = entry
+    filtered_ontology = {tag: filtered_ontology[tag] for tag in sorted(filtered_ontology)}
+
+    # 4) Build new question bank
+    return {
+        "ontology": filtered_ontology,
+        "lectures": keep_lectures,
+        "assignments": []
+    }
+
+if __name__ == "__main__":
+    new_qb = extract_lecture_bank(IN_PATH, TARGET_LECTURE_ID)
+
+    with open(OUT_PATH, "wb") as f:
+        f.write(orjson.dumps(new_qb, option=orjson.OPT_INDENT_2))
+
+    print(f"Wrote {OUT_PATH}")
+    print(f"Kept lecture: {TARGET_LECTURE_ID}")
+    print(f"Kept tags: {sorted({tag for lec in new_qb['lectures'] for q in lec.get('questions', []) for tag in q.get('concept_tags', [])})}")
@@ -7,42 +7,54 @@ Input: question_bank.json (curriculum JSON)
 Output: student_attempts.jsonl (one JSON record per student-question)
 
 Overview:
-Each student answers every question exactly once. 
+Each student answers every question exactly once.
 Each student is assigned K "weak" concept tags.
 If a question has any weak tag, student is likely to get it wrong.
-Otherwise, student is likely to get it right. 
+Otherwise, student is likely to get it right.
 """
 
 # --------------
-# Import modules 
+# Import modules
 # --------------
-import json 
-from typing import Set, Any, Dict, List 
-import random 
-import argparse 
+import gzip
+import io
+import os
+import orjson
+import numpy as np
+from typing import Any, Dict, List, NamedTuple, Optional
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from extract_question_bank import extract_lecture_bank
+
+try:
+    from numba import njit, prange
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
 
 # ----------------
 # Helper functions
 # ----------------
 def load_question_bank(path: str) -> Dict[str, Any]:
     """
-    Load the question bank JSON file from disk. 
+    Load the question bank JSON file from disk.
     """
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f) 
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
 
 def iter_all_questions(question_bank: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
-    Return a flat list of ALL QUESTIONS in the curriculum. 
+    Return a flat list of ALL QUESTIONS in the curriculum.
 
     The question banks stores questions in a nested structure:
     - lecture -> questions
     - assignment -> parts -> questions.
 
-    This function walks through that structure, specified above, and collects every question dictionary into 
-    a single list. 
+    This function walks through that structure, specified above, and collects every question dictionary into
+    a single list.
     """
-    out = [] 
+    out = []
 
     # Lectures
     for lec in question_bank.get("lectures", []):
@@ -52,65 +64,285 @@ def iter_all_questions(question_bank: Dict[str, Any]) -> List[Dict[str, Any]]:
     for asg in question_bank.get("assignments", []):
         for part in asg.get("parts", []):
             out.extend(part.get("questions", []))
-    
-    return out 
 
-def choose_weak_tags(all_tags: List[str], rng: random.Random, k_min: int = 1, k_max: int = 3) -> List[str]:
+    return out
+
+def build_question_tag_masks(questions: List[Dict[str, Any]], all_tags: List[str]) -> np.ndarray:
+    """
+    Encode each question's tag set as a single uint64 bitmask (bit i = tag i).
+
+    Requires len(all_tags) <= 64; callers fall back to the (Q, T) bitmap
+    matrix otherwise.
+    """
+    tag_to_bit = {t: 1 << i for i, t in enumerate(all_tags)}
+    return np.fromiter(
+        (sum(tag_to_bit[t] for t in set(q.get("concept_tags", []))) for q in questions),
+        dtype=np.uint64,
+        count=len(questions),
+    )
+
+def build_question_tag_matrix(questions: List[Dict[str, Any]], all_tags: List[str]) -> np.ndarray:
+    """
+    Build a (Q, T) uint8 bitmap: entry [q, t] is 1 if question q uses tag t.
+    """
+    tag_index = {t: i for i, t in enumerate(all_tags)}
+    qtag = np.zeros((len(questions), len(all_tags)), dtype=np.uint8)
+    for qi, q in enumerate(questions):
+        for t in q.get("concept_tags", []):
+            qtag[qi, tag_index[t]] = 1
+    return qtag
+
+def clamp_weak_tag_bounds(k_min: int, k_max: int, num_tags: int) -> tuple:
     """
-    Pick k weak tags for a student, k is random in [k_min, k_max].
+    Clamp [k_min, k_max] to the number of available tags, once up front,
+    so the sampling path takes pre-validated bounds and stays branch-free.
     """
-    if not all_tags:
-        return []
-    k_low = max(0, min(k_min, len(all_tags)))
-    k_high = max(0, min(k_max, len(all_tags)))
+    k_low = max(0, min(k_min, num_tags))
+    k_high = max(0, min(k_max, num_tags))
     if k_low > k_high:
-        k_low = k_high 
-    k = rng.randint(k_low, k_high)
-    return rng.sample(all_tags, k)
+        k_low = k_high
+    return k_low, k_high
 
-def any_weak_tag(question_tags: List[str], weak_tags_set: set) -> bool:
+def sample_weak_tag_matrix(num_students: int, num_tags: int, rng: np.random.Generator,
+    k_low: int, k_high: int) -> np.ndarray:
     """
-    True if this question touches any tag the student is weak at.
-    """
-    return any(t in weak_tags_set for t in question_tags)
+    Sample each student's weak tags as one (S, T) boolean matrix.
 
-def pick_answer_single_select(options: Dict[str, str], correct_options: List[str], want_correct: bool, rng: random.Random) -> List[str]:
+    For each student, k is random in [k_low, k_high] and k tags are chosen
+    without replacement. Bounds must already be clamped to num_tags (see
+    clamp_weak_tag_bounds).
+    """
+    if num_tags == 0:
+        return np.zeros((num_students, 0), dtype=bool)
+    ks = rng.integers(k_low, k_high + 1, size=num_students)
+
+    # Rank a random matrix per row: the k smallest ranks are the chosen tags.
+    # This samples k tags without replacement for every student at once.
+    ranks = rng.random((num_students, num_tags)).argsort(axis=1).argsort(axis=1)
+    return ranks < ks[:, None]
+
+if HAVE_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def decide_correct_kernel(w_masks, q_masks, uniforms, p_wrong_if_weak, p_wrong_if_strong):
+        """
+        Fused decision kernel: weak-tag bitmask test + correctness draw in one
+        parallel pass, without materializing the intermediate (S, Q) arrays.
+        """
+        num_students, num_questions = uniforms.shape
+        out = np.empty((num_students, num_questions), dtype=np.bool_)
+        for s in prange(num_students):
+            for qi in range(num_questions):
+                p_wrong = p_wrong_if_weak if (w_masks[s] & q_masks[qi]) else p_wrong_if_strong
+                out[s, qi] = uniforms[s, qi] > p_wrong
+        return out
+
+def write_vectored(fd: int, chunks: List[bytes]) -> None:
     """
-    Simulate a student's answer to a single_select MCQ.
-    correct_options must be a list of exactly one key, e.g., ["B"]. 
-    Returns a list like ["A"]. 
+    Write a batch of byte chunks with gather I/O: one os.writev syscall
+    covers up to IOV_MAX chunks, instead of one write per chunk or an
+    extra copy to concatenate them first. Handles partial writes.
     """
-    if len(correct_options) != 1:
-        raise ValueError(f"single_select expects exactly 1 correct options, got {correct_options}")
-        
-    all_keys = list(options.keys())
-    correct_option = correct_options[0]
+    iov_max = 1024
+    start = 0
+    while start < len(chunks):
+        batch = chunks[start:start + iov_max]
+        written = os.writev(fd, batch)
+        # Skip fully written chunks; re-queue the tail of a partial one.
+        for chunk in batch:
+            if written < len(chunk):
+                chunks[start] = chunk[written:]
+                break
+            written -= len(chunk)
+            start += 1
+
+# ----------------
+# Core generation
+# ----------------
 
-    if want_correct:
-        return [correct_option]
+# Students are simulated in fixed-size shards so the output is identical
+# regardless of how many worker processes are used.
+SHARD_STUDENTS = 1000
 
-    wrong_keys = [k for k in all_keys if k != correct_option]
-    return [rng.choice(wrong_keys)]
+# Shard blobs are gathered and flushed together, a few syscalls per run.
+WRITE_BATCH_BYTES = 32 << 20
 
-def decide_correct(has_weak: bool, rng: random.Random, p_wrong_if_weak: float, p_wrong_if_strong: float) -> bool:
+class QuestionData(NamedTuple):
     """
-    Decide whether a student answers a question correctly.
+    Structure-of-arrays view of the question bank: one parallel list/array
+    per field instead of the list-of-dicts shape the JSON arrives in.
+    Exactly one of (q_masks, tag_bits) and qtag_matrix is populated,
+    depending on whether the tag vocabulary fits in a uint64.
+    """
+    num_tags: int
+    ids: List[str]
+    tags: List[List[str]]
+    options: List[Dict[str, str]]
+    correct: List[List[str]]
+    n_wrong: np.ndarray
+    templates: List[bytes]
+    correct_key_json: List[bytes]
+    wrong_key_json: List[List[bytes]]
+    max_wrong_options: int
+    q_masks: Optional[np.ndarray] = None
+    tag_bits: Optional[np.ndarray] = None
+    qtag_matrix: Optional[np.ndarray] = None
+
+def precompute_questions(questions: List[Dict[str, Any]], all_tags: List[str]) -> QuestionData:
+    """
+    Build every per-question constant the simulation needs, once.
 
-    This function is designed to simulate realistic student behaviour, in that:
-    - If a question involves a concept with which the student is weak, they are MORE LIKELY to answer incorrectly.
-    - If a question is strong on a concept, they are STILL POSSIBLE (though less likely to answer incorrectly).
+    Returns a QuestionData with the hoisted question metadata (ids, tags,
+    options, correct keys), the tag bitmasks/bitmap for the weak-tag test,
+    and the pre-serialized byte templates used to emit records.
+    """
+    # All per-question validation runs here, once, so the serialization loop
+    # can index precomputed arrays without any checks.
+    for q in questions:
+        qtype = q.get("question_type", "single_select")
+        if qtype != "single_select":
+            raise ValueError(f"Unsupported question_type: {qtype} (question_id={q['question_id']})")
+        if len(q["correct_options"]) != 1:
+            raise ValueError(f"single_select expects exactly 1 correct options, got {q['correct_options']}")
+
+    q_ids = [q["question_id"] for q in questions]
+    q_tags = [q.get("concept_tags", []) for q in questions]
+    q_options = [q["options"] for q in questions]
+    q_correct = [q["correct_options"] for q in questions]
+
+    # Wrong-answer keys per question, as a plain array of choices that a
+    # pre-drawn integer can index directly.
+    q_wrong_keys = [[k for k in opts if k != correct[0]]
+                    for opts, correct in zip(q_options, q_correct)]
+    n_wrong = np.array([max(len(wk), 1) for wk in q_wrong_keys], dtype=np.int64)
+
+    # Pre-serialize one byte template per question. Only student_id, the
+    # selected key and is_correct vary between records, so each line is a
+    # single %-substitution instead of a dict build + full JSON encode.
+    # Static fragments get "%" escaped so they are inert under %-formatting.
+    # Identical tag lists and option keys recur across many questions, so
+    # their encodings are interned: each distinct value is encoded once and
+    # the same bytes object is shared by every question that uses it.
+    tags_json_cache: Dict[tuple, bytes] = {}
+    key_json_cache: Dict[str, bytes] = {}
+
+    q_templates: List[bytes] = []
+    q_correct_json: List[bytes] = []
+    q_wrong_json: List[List[bytes]] = []
+    for qi in range(len(questions)):
+        qid_json = orjson.dumps(q_ids[qi]).replace(b"%", b"%%")
+        tags_key = tuple(q_tags[qi])
+        tags_json = tags_json_cache.get(tags_key)
+        if tags_json is None:
+            tags_json = tags_json_cache[tags_key] = orjson.dumps(q_tags[qi]).replace(b"%", b"%%")
+        q_templates.append(
+            b'{"student_id":%b,"question_id":' + qid_json
+            + b',"selected_options":[%b],"is_correct":%b,"concept_tags":' + tags_json + b'}\n'
+        )
+        q_correct_json.append(key_json_cache.setdefault(q_correct[qi][0], orjson.dumps(q_correct[qi][0])))
+        q_wrong_json.append([key_json_cache.setdefault(k, orjson.dumps(k)) for k in q_wrong_keys[qi]])
+
+    common = dict(
+        num_tags=len(all_tags),
+        ids=q_ids,
+        tags=q_tags,
+        options=q_options,
+        correct=q_correct,
+        n_wrong=n_wrong,
+        templates=q_templates,
+        correct_key_json=q_correct_json,
+        wrong_key_json=q_wrong_json,
+        max_wrong_options=max((len(q.get("options", {})) - 1 for q in questions), default=1),
+    )
+    if len(all_tags) <= 64:
+        return QuestionData(
+            **common,
+            q_masks=build_question_tag_masks(questions, all_tags),
+            tag_bits=np.left_shift(np.uint64(1), np.arange(len(all_tags), dtype=np.uint64)),
+        )
+    return QuestionData(**common, qtag_matrix=build_question_tag_matrix(questions, all_tags))
+
+def generate_shard(precomp: QuestionData, shard_seed: np.random.SeedSequence, student_start: int,
+    shard_students: int, k_low: int, k_high: int, p_wrong_if_weak: float, p_wrong_if_strong: float) -> bytes:
     """
-    p_wrong = p_wrong_if_weak if has_weak else p_wrong_if_strong
-    return rng.random() > p_wrong 
+    Simulate and serialize one shard of students, returning its JSONL bytes.
+
+    Each shard has its own SeedSequence-derived generator, so shards are
+    independent and can run in any process.
+    """
+    rng = np.random.default_rng(shard_seed)
+    num_questions = len(precomp.ids)
+
+    # Vectorized simulation: the weak-tag test collapses to one bitwise AND
+    # per (student, question) pair when the tag vocabulary fits in a uint64;
+    # otherwise fall back to the (Q, T) bitmap matmul.
+    weak_matrix = sample_weak_tag_matrix(shard_students, precomp.num_tags, rng, k_low, k_high)
+
+    # Bulk random draws: one float32 uniform per (student, question) for the
+    # correctness decision and one pre-drawn integer for the wrong-key pick,
+    # instead of a Python-level RNG call per record.
+    uniforms = rng.random((shard_students, num_questions), dtype=np.float32)
+    p_weak = np.float32(p_wrong_if_weak)
+    p_strong = np.float32(p_wrong_if_strong)
+
+    if precomp.q_masks is not None:
+        w_masks = (weak_matrix * precomp.tag_bits).sum(axis=1, dtype=np.uint64)
+        if HAVE_NUMBA:
+            # JIT-compiled kernel fuses the mask test and the decision.
+            is_correct_matrix = decide_correct_kernel(w_masks, precomp.q_masks, uniforms, p_weak, p_strong)
+        else:
+            has_weak = (w_masks[:, None] & precomp.q_masks[None, :]) != 0
+            is_correct_matrix = uniforms > np.where(has_weak, p_weak, p_strong)
+    else:
+        has_weak = (weak_matrix.astype(np.uint8) @ precomp.qtag_matrix.T) > 0
+        is_correct_matrix = uniforms > np.where(has_weak, p_weak, p_strong)
+    wrong_choice_idx = rng.integers(0, max(precomp.max_wrong_options, 1), size=(shard_students, num_questions))
+    # Reduce every draw to a valid index into its question's wrong-key array
+    # in one vectorized modulo, instead of a Python `%` per record.
+    wrong_choice_idx %= precomp.n_wrong[None, :]
+
+    q_templates = precomp.templates
+    q_correct_json = precomp.correct_key_json
+    q_wrong_json = precomp.wrong_key_json
+
+    # Serialize into one growable BytesIO arena rather than a list of line
+    # objects joined at the end: no per-line list bookkeeping and no second
+    # full copy of the shard during the join. All keys are pre-validated and
+    # pre-encoded, so each record is a template substitution and nothing else.
+    # Pre-encode every student_id fragment for the shard; with the question
+    # fragments already encoded in the templates, no unicode value is
+    # encoded inside the record loop.
+    student_id_json = [b'"S%06d"' % (student_start + si) for si in range(shard_students)]
+
+    arena = io.BytesIO()
+    for si in range(shard_students):
+        sid_json = student_id_json[si]
+
+        for qi in range(num_questions):
+            if is_correct_matrix[si, qi]:
+                key_json = q_correct_json[qi]
+                correct_json = b"true"
+            else:
+                key_json = q_wrong_json[qi][wrong_choice_idx[si, qi]]
+                correct_json = b"false"
+
+            arena.write(q_templates[qi] % (sid_json, key_json, correct_json))
+
+    return arena.getvalue()
 
-# ----------------
-# Core generation
-# ----------------
 def generate_attempts(question_bank_path: str, out_path: str, num_students: int, seed: int, k_min: int,
-    k_max: int, p_wrong_if_weak: float, p_wrong_if_strong: float) -> None:
+    k_max: int, p_wrong_if_weak: float, p_wrong_if_strong: float, workers: int = 1,
+    lecture_id: Optional[str] = None) -> None:
     """
     Generate a JSONL file where each line is one student answering one question.
 
+    Students are split into fixed-size shards; each shard is simulated with
+    NumPy array operations and serialized to bytes, optionally across
+    `workers` processes, and the shards are written out in order.
+
+    If lecture_id is given, the question bank is filtered to that lecture
+    in memory (via extract_question_bank.extract_lecture_bank), so there is
+    no need to write and re-read a pre-extracted question bank file.
+
     Output record schema:
     {
         "student_id": "S000123",
@@ -120,52 +352,55 @@ def generate_attempts(question_bank_path: str, out_path: str, num_students: int,
         "concept_tags": ["AI_HISTORY_FOUNDING"]
     }
     """
-    rng = random.Random(seed)
-
-    qb = load_question_bank(question_bank_path)
+    if lecture_id is not None:
+        qb = extract_lecture_bank(question_bank_path, lecture_id)
+    else:
+        qb = load_question_bank(question_bank_path)
     questions = iter_all_questions(qb)
 
     all_tags = sorted({tag for q in questions for tag in q.get("concept_tags", [])})
-
-    with open(out_path, "w", encoding="utf-8") as f_out:
-        for s in range(num_students):
-            student_id = f"S{s:06d}"
-
-            weak_tags = choose_weak_tags(all_tags, rng=rng, k_min=k_min, k_max=k_max)
-            weak_set = set(weak_tags)
-
-            for q in questions:
-                qid = q["question_id"]
-                qtags = q.get("concept_tags", [])
-                has_weak = any_weak_tag(qtags, weak_set)
-
-                is_correct = decide_correct(
-                    has_weak=has_weak,
-                    rng=rng,
-                    p_wrong_if_weak=p_wrong_if_weak,
-                    p_wrong_if_strong=p_wrong_if_strong,
-                )
-
-                qtype = q.get("question_type", "single_select")
-                if qtype == "single_select":
-                    selected = pick_answer_single_select(
-                        options=q["options"],
-                        correct_options=q["correct_options"],
-                        want_correct=is_correct,
-                        rng=rng,
-                    )
-                else:
-                    raise ValueError(f"Unsupported question_type: {qtype} (question_id={qid})")
-
-                record = {
-                    "student_id": student_id,
-                    "question_id": qid,
-                    "selected_options": selected,
-                    "is_correct": is_correct,
-                    "concept_tags": qtags,
-                }
-
-                f_out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    precomp = precompute_questions(questions, all_tags)
+
+    k_low, k_high = clamp_weak_tag_bounds(k_min, k_max, len(all_tags))
+
+    starts = list(range(0, num_students, SHARD_STUDENTS))
+    shard_seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    shard_args = [
+        (precomp, shard_seeds[i], start, min(SHARD_STUDENTS, num_students - start),
+         k_low, k_high, p_wrong_if_weak, p_wrong_if_strong)
+        for i, start in enumerate(starts)
+    ]
+
+    def shard_results():
+        if workers > 1 and len(shard_args) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                yield from pool.map(generate_shard, *zip(*shard_args))
+        else:
+            for args in shard_args:
+                yield generate_shard(*args)
+
+    # A .gz out path streams each shard through gzip as it completes,
+    # trading CPU for disk bandwidth on large runs.
+    if out_path.endswith(".gz"):
+        with gzip.open(out_path, "wb") as f_out:
+            for shard_bytes in shard_results():
+                f_out.write(shard_bytes)
+        return
+
+    # Gather shard blobs and flush them with vectored writes: the file is
+    # unbuffered, so there is no extra copy through a Python-level buffer.
+    with open(out_path, "wb", buffering=0) as f_out:
+        pending: List[bytes] = []
+        pending_bytes = 0
+        for shard_bytes in shard_results():
+            pending.append(shard_bytes)
+            pending_bytes += len(shard_bytes)
+            if pending_bytes >= WRITE_BATCH_BYTES:
+                write_vectored(f_out.fileno(), pending)
+                pending = []
+                pending_bytes = 0
+        if pending:
+            write_vectored(f_out.fileno(), pending)
 
 # -----------------
 # Run from terminal
@@ -174,15 +409,17 @@ def generate_attempts(question_bank_path: str, out_path: str, num_students: int,
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate synthetic student attempt logs (JSONL) from a question_bank.json file.")
     parser.add_argument("--question-bank", type=str, default="question_bank_L1_1_only.json", help="Path to question_bank.json")
-    parser.add_argument("--out", type=str, default="student_attempts.jsonl", help="Output path for student_attempts.jsonl")
+    parser.add_argument("--out", type=str, default="student_attempts.jsonl", help="Output path for student_attempts.jsonl (a .gz suffix enables gzip compression)")
     parser.add_argument("--num-students", default=100, type=int, help="Number of students to simulate")
     parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
     parser.add_argument("--k-min", type=int, default=1, help="Minimum number of weak concept tags per student")
     parser.add_argument("--k-max", type=int, default=3, help="Maximum number of weak concept tags per student")
     parser.add_argument("--p-wrong-if-weak", type=float, default=0.35, help="Probability of wrong answer if question touches a weak tag")
     parser.add_argument("--p-wrong-if-strong", type=float, default=0.10, help="Probability of wrong answer if question does NOT touch a weak tag")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes (shards of students run in parallel)")
+    parser.add_argument("--lecture-id", type=str, default=None, help="Filter the question bank to one lecture in memory (skips the pre-extracted file)")
 
-    args = parser.parse_args() 
+    args = parser.parse_args()
 
     generate_attempts(
             question_bank_path=args.question_bank,
@@ -193,4 +430,6 @@ if __name__ == "__main__":
             k_max=args.k_max,
             p_wrong_if_weak=args.p_wrong_if_weak,
             p_wrong_if_strong=args.p_wrong_if_strong,
-        )
\ No newline at end of file
+            workers=args.workers,
+            lecture_id=args.lecture_id,
+        )